@@ -1,86 +1,327 @@
-def ChromosomeToCycle(c):
-    Nodes=[]
-    for i in range (0,len(c)):
-        j=c[i];
-        if (int(j)>0):
-            Nodes.append(2*int(j)-1)
-            Nodes.append(2*int(j))
-        else:
-            Nodes.append(-2*int(j))
-            Nodes.append(-2*int(j)-1)
+from itertools import chain
+from typing import NamedTuple
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit("int64[:](int64[:])",cache=True)
+    def _ChromosomeToCycleJit(c):
+        Nodes=np.empty(2*len(c),dtype=np.int64)
+        for i in range(len(c)):
+            j=c[i]
+            if j>0:
+                Nodes[2*i]=2*j-1
+                Nodes[2*i+1]=2*j
+            else:
+                Nodes[2*i]=-2*j
+                Nodes[2*i+1]=-2*j-1
+        return Nodes
+
+    @njit("int64[:](int64[:])",cache=True)
+    def _CycleToChromosomeJit(Nodes):
+        c=np.empty(len(Nodes)//2,dtype=np.int64)
+        for i in range(len(c)):
+            if Nodes[2*i]<Nodes[2*i+1]:
+                c[i]=Nodes[2*i+1]//2
+            else:
+                c[i]=-Nodes[2*i]//2
+        return c
+
+def ChromosomeToCycleNp(c):
+    c=np.asarray(c,dtype=np.int64)
+    if njit is not None:
+        return _ChromosomeToCycleJit(np.require(c,requirements='W'))
+    pos=c>0
+    Nodes=np.empty(2*len(c),dtype=np.int64)
+    Nodes[0::2]=np.where(pos,2*c-1,-2*c)
+    Nodes[1::2]=np.where(pos,2*c,-2*c-1)
     return Nodes
 
-def CycleToChromosome(Nodes):
-    c=[]
-    for i in range(0,int(len(Nodes)/2)):
-        if (Nodes[2*i]<Nodes[2*i+1]):
-            c.append(int(Nodes[2*i+1]/2))
+def _ChromosomeNodes(c):
+    for j in c:
+        j=int(j)
+        if (j>0):
+            yield 2*j-1
+            yield 2*j
         else:
-            c.append(int(-Nodes[2*i]/2))
-    return c
+            yield -2*j
+            yield -2*j-1
+
+def ChromosomeToCycle(c):
+    if np is not None:
+        return ChromosomeToCycleNp(c).tolist()
+    return list(_ChromosomeNodes(c))
+
+def CycleToChromosomeNp(Nodes):
+    if njit is not None:
+        return _CycleToChromosomeJit(np.require(np.asarray(Nodes,dtype=np.int64).ravel(),requirements='W'))
+    Nodes=np.asarray(Nodes,dtype=np.int64).reshape(-1,2)
+    fwd=Nodes[:,0]<Nodes[:,1]
+    return np.where(fwd,Nodes[:,1]//2,-Nodes[:,0]//2)
+
+def CycleToChromosome(Nodes):
+    if np is not None:
+        return CycleToChromosomeNp(Nodes).tolist()
+    it=iter(Nodes)
+    return [y//2 if x<y else -x//2 for x,y in zip(it,it)]
+
+def ColoredEdgesNp(P):
+    P=list(P)
+    lengths=np.fromiter(map(len,P),dtype=np.int64,count=len(P))
+    genes=np.fromiter((g for chromosome in P for g in chromosome),dtype=np.int64,count=int(lengths.sum()))
+    pos=genes>0
+    heads=np.where(pos,2*genes-1,-2*genes)
+    tails=np.where(pos,2*genes,-2*genes-1)
+    ends=np.cumsum(lengths)[lengths>0]
+    nxt=np.arange(1,len(genes)+1)
+    nxt[ends-1]=ends-lengths[lengths>0]
+    return np.column_stack([tails,heads[nxt]])
+
+class GenomeGraph(NamedTuple):
+    src: "np.ndarray"
+    dst: "np.ndarray"
+
+    def as_tuple_of_tuples(self):
+        return tuple(zip(self.src.tolist(),self.dst.tolist()))
+
+def ColoredEdgesGraph(P):
+    edges=ColoredEdgesNp(P)
+    return GenomeGraph(np.ascontiguousarray(edges[:,0]),np.ascontiguousarray(edges[:,1]))
 
 def ColoredEdges(P):
+    if np is not None:
+        return ColoredEdgesGraph(P).as_tuple_of_tuples()
     edges=[]
     for chromosome in P:
         Nodes=ChromosomeToCycle(chromosome)
-        for j in range(0,len(chromosome)):
-            pair=(Nodes[2*j+1],Nodes[(2*j+2)%len(Nodes)])
-            edges.append(tuple(pair))
+        edges+=[(Nodes[2*j+1],Nodes[2*j+2]) for j in range(0,len(chromosome)-1)]
+        if Nodes:
+            edges.append((Nodes[-1],Nodes[0]))
     return tuple(edges)
 
-def GraphToGenome(Graph):
-        genome = []
-        init = Graph[0][0]
-        if (init%2 == 0):
-            end = init-1
+def WalkCycle(adj,start):
+    p=[]
+    Nodes=[]
+    node=start
+    while(True):
+        if (node & 1):
+            p.append((node+1) >> 1)
+            out=node+1
         else:
-            end = init+1
-        p = []
-        i=0
-        while(True):
-            if (init%2 == 0):
-                p.append(int(init/2))
-            else:
-                p.append(int(-(init+1)/2))
-            next1 = Graph[i][1]
-            if (next1 == end):
-                genome.append(tuple(p))
-                if(i==len(Graph)):
-                    break
-                i=i+1
-                if(i==len(Graph)):
-                    break
-                init=Graph[i][0]
-                if (init%2 == 0):
-                    end = init-1
-                else:
-                    end = init+1
-                p=[]
-                continue
-            i=i+1
-            init=Graph[i][0]
-        return tuple(genome)
+            p.append(-(node >> 1))
+            out=node-1
+        Nodes.append(node)
+        Nodes.append(out)
+        node=adj[out]
+        if (node == start):
+            break
+    return tuple(p),Nodes
+
+def GraphArrays(Graph):
+    if isinstance(Graph,GenomeGraph):
+        return Graph
+    if not isinstance(Graph,np.ndarray):
+        Graph=np.fromiter(chain.from_iterable(Graph),dtype=np.int64)
+    return np.asarray(Graph,dtype=np.int64).reshape(-1,2).T
+
+def GraphSegments(src,dst):
+    if len(src)==0:
+        return None
+    end=np.where(dst&1,dst+1,dst-1)
+    breaks=np.flatnonzero(end[:-1]!=src[1:])+1
+    first=np.concatenate(([0],breaks))
+    last=np.append(breaks,len(src))-1
+    if (end[last]==src[first]).all():
+        return breaks
+    return None
+
+def GraphToGenome(Graph):
+        if np is not None:
+            src,dst=GraphArrays(Graph)
+            if len(src)==0:
+                return ()
+            breaks=GraphSegments(src,dst)
+            if breaks is not None:
+                genes=np.where(src&1,-((src+1)>>1),src>>1)
+                return tuple(tuple(p.tolist()) for p in np.split(genes,breaks))
+            Graph=zip(src.tolist(),dst.tolist())
+        return SortingSession.FromGraph(Graph).Genome()
+
+
+def EdgeKey(x,y):
+    return (x,y) if x<y else (y,x)
+
+def MakeTwoBreak(edges,index):
+    pop=index.pop
+    def TwoBreak(a,b,c,d):
+        i=pop((a,b) if a<b else (b,a))
+        j=pop((c,d) if c<d else (d,c))
+        new={a:c,c:a,b:d,d:b}
+        x,y=edges[i]
+        ei=edges[i]=(x,new[x])
+        x,y=edges[j]
+        ej=edges[j]=(x,new[x]) if x not in ei else (new[y],y)
+        index[EdgeKey(*ei)]=i
+        index[EdgeKey(*ej)]=j
+        return edges
+    return TwoBreak
 
+class TwoBreakGraph:
+    def __init__(self,Graph):
+        self.edges=list(Graph)
+        self.index={EdgeKey(*g):i for i,g in enumerate(self.edges)}
+        self.TwoBreak=MakeTwoBreak(self.edges,self.index)
+
+def TwoBreakGenomeGraphNp(Graph,a,b,c,d):
+    src,dst=Graph.src.copy(),Graph.dst.copy()
+    i=np.flatnonzero(((src==a)&(dst==b))|((src==b)&(dst==a)))
+    if len(i)==0:
+        raise KeyError((a,b))
+    j=np.flatnonzero(((src==c)&(dst==d))|((src==d)&(dst==c)))
+    if len(j)==0:
+        raise KeyError((c,d))
+    i,j=i[0],j[0]
+    new={a:c,c:a,b:d,d:b}
+    x=int(src[i])
+    dst[i]=new[x]
+    x,y=int(src[j]),int(dst[j])
+    if x!=src[i] and x!=dst[i]:
+        dst[j]=new[x]
+    else:
+        src[j]=new[y]
+    return GenomeGraph(src,dst)
 
 def TwoBreakGenomeGraph(genome,a,b,c,d):
-    cgenome=[]
-    for g in genome:
-        if(g==(a,b)):
-            cgenome.append((a,c))
-        elif(g==(b,a)):
-            cgenome.append((b,d))
-        elif(g==(c,d)):
-            cgenome.append((c,a))
-        elif(g==(d,c)):
-            cgenome.append((d,b))
+    if isinstance(genome,GenomeGraph):
+        return TwoBreakGenomeGraphNp(genome,a,b,c,d)
+    return TwoBreakGraph(genome).TwoBreak(a,b,c,d)
+
+def NodeTables(src,dst,seg):
+    size=int(max(src.max(),dst.max()))+1 if len(src) else 1
+    adj=np.zeros(size,dtype=np.int64)
+    adj[src]=dst
+    adj[dst]=src
+    cycleOf=np.full(size,-1,dtype=np.int64)
+    cycleOf[src]=seg
+    cycleOf[np.where(src&1,src+1,src-1)]=seg
+    return adj.tolist(),cycleOf.tolist()
+
+class SortingSession:
+    def __init__(self,genome):
+        genome=[tuple(chromosome) for chromosome in genome]
+        self.cycles=dict(enumerate(genome))
+        self.nextId=len(genome)
+        if np is not None:
+            src,dst=ColoredEdgesGraph(genome)
+            lengths=np.fromiter(map(len,genome),dtype=np.int64,count=len(genome))
+            seg=np.repeat(np.arange(len(genome)),lengths)
+            self.adj,self.cycleOf=NodeTables(src,dst,seg)
+            return
+        size=2*max((abs(int(g)) for chromosome in genome for g in chromosome),default=0)+1
+        adj,cycleOf=[0]*size,[-1]*size
+        for k,chromosome in enumerate(genome):
+            Nodes=ChromosomeToCycle(chromosome)
+            for node in Nodes:
+                cycleOf[node]=k
+            for x,y in zip(Nodes[1::2],Nodes[2::2]+Nodes[:1]):
+                adj[x]=y
+                adj[y]=x
+        self.adj,self.cycleOf=adj,cycleOf
+
+    @classmethod
+    def FromGraph(cls,Graph):
+        self=cls.__new__(cls)
+        if np is not None:
+            src,dst=GraphArrays(Graph)
+            breaks=GraphSegments(src,dst)
+            if breaks is not None:
+                genes=np.where(src&1,-((src+1)>>1),src>>1)
+                self.cycles=dict(enumerate(tuple(p.tolist()) for p in np.split(genes,breaks)))
+                self.nextId=len(self.cycles)
+                seg=np.zeros(len(src),dtype=np.int64)
+                seg[breaks]=1
+                self.adj,self.cycleOf=NodeTables(src,dst,np.cumsum(seg))
+                return self
+            Graph=zip(src.tolist(),dst.tolist())
+        Graph=list(Graph)
+        size=max(chain.from_iterable(Graph),default=0)+1
+        adj,cycles,cycleOf=[0]*size,{},[-1]*size
+        for x,y in Graph:
+            adj[x]=y
+            adj[y]=x
+        for init,_ in Graph:
+            if cycleOf[init]>=0:
+                continue
+            chromosome,Nodes=WalkCycle(adj,init+1 if init & 1 else init-1)
+            k=len(cycles)
+            cycles[k]=chromosome
+            for node in Nodes:
+                cycleOf[node]=k
+        self.adj,self.cycles,self.cycleOf=adj,cycles,cycleOf
+        self.nextId=len(cycles)
+        return self
+
+    def TwoBreak(self,a,b,c,d):
+        adj,cycles,cycleOf=self.adj,self.cycles,self.cycleOf
+        if not (0<a<len(adj) and adj[a]==b):
+            raise KeyError((a,b))
+        if not (0<c<len(adj) and adj[c]==d):
+            raise KeyError((c,d))
+        adj[a]=c
+        adj[c]=a
+        adj[b]=d
+        adj[d]=b
+        k,l=cycleOf[a],cycleOf[c]
+        if l!=k:
+            ids=list(cycles)
+            if ids.index(l)<ids.index(k):
+                k,l=l,k
+            old=cycles[k]+cycles.pop(l)
         else:
-            cgenome.append(g)
-    return cgenome
-
-def TwoBreakOnGenome(genome,a,b,c,d):
-    g=ColoredEdges(genome)
-    g=TwoBreakOnGenomeGraph(g,a,b,c,d)
-    genome=GraphToGenome(g)
-    return genome
+            old=cycles[k]
+        rank={abs(g):i for i,g in enumerate(old)}
+        new=[]
+        done=set()
+        for start in (a,b):
+            if start in done:
+                continue
+            chromosome,Nodes=WalkCycle(adj,start)
+            r=min(range(len(chromosome)),key=lambda i:rank[abs(chromosome[i])])
+            if (chromosome[r]!=old[rank[abs(chromosome[r])]]):
+                chromosome=tuple(-g for g in reversed(chromosome))
+                Nodes=Nodes[::-1]
+                r=len(chromosome)-1-r
+            new.append((rank[abs(chromosome[r])],chromosome[r:]+chromosome[:r],Nodes))
+            done.update(Nodes)
+        new.sort(key=lambda t:t[0])
+        _,chromosome,Nodes=new[0]
+        cycles[k]=chromosome
+        for node in Nodes:
+            cycleOf[node]=k
+        if len(new)==2:
+            _,chromosome,Nodes=new[1]
+            l=self.nextId
+            self.nextId+=1
+            for node in Nodes:
+                cycleOf[node]=l
+            items=list(cycles.items())
+            pos=list(cycles).index(k)+1
+            self.cycles=dict(items[:pos]+[(l,chromosome)]+items[pos:])
+        return self
+
+    def Genome(self):
+        return tuple(self.cycles.values())
+
+def TwoBreakOnGenome(genome,a,b,c,d,Graph=None):
+    """When Graph is given it is used instead of genome, and is not modified."""
+    if Graph is not None:
+        return SortingSession.FromGraph(Graph).TwoBreak(a,b,c,d).Genome()
+    return SortingSession(genome).TwoBreak(a,b,c,d).Genome()
 
                 